@@ -19,7 +19,10 @@ Example JSON message
     "message_length": 42
 }
 
-Database stores: hour_of_day, keyword, count, last_updated
+Database stores:
+- keywords: id, name (each keyword once)
+- keyword_popularity: hour_of_day, keyword_id, count, last_updated
+- keyword_counts (view): hour_of_day, keyword, count, last_updated
 """
 
 #####################################
@@ -27,13 +30,29 @@ Database stores: hour_of_day, keyword, count, last_updated
 #####################################
 
 # import from standard library
-import json
 import os
 import pathlib
 import sqlite3
 import sys
 import time
-from datetime import datetime
+from collections import Counter
+from contextlib import contextmanager
+
+# import from external packages (optional)
+try:
+    import orjson as _json  # C-accelerated decoder; accepts bytes directly
+except ImportError:  # pragma: no cover
+    import json as _json
+
+try:
+    import apsw  # thinner C bindings to SQLite than the sqlite3 module
+except ImportError:  # pragma: no cover
+    apsw = None
+
+try:
+    import inotify_simple  # Linux only
+except ImportError:  # pragma: no cover
+    inotify_simple = None
 
 # import from local modules
 import utils.utils_config as config
@@ -43,90 +62,188 @@ from utils.utils_logger import logger
 # Database Functions
 #####################################
 
+# Kept as one constant so the connection's statement cache reuses the
+# compiled statement on every flush
+_UPSERT_SQL = """
+INSERT INTO keyword_popularity (hour_of_day, keyword_id, count, last_updated)
+VALUES (?, ?, ?, ?)
+ON CONFLICT(hour_of_day, keyword_id) DO UPDATE
+SET count = count + excluded.count, last_updated = excluded.last_updated
+"""
 
-def init_keyword_db(db_path: pathlib.Path):
+# Single connection opened by init_keyword_db() and kept for the life of the consumer
+# (an apsw.Connection when apsw is installed, otherwise a sqlite3.Connection)
+_CONN = None
+
+# Keyword name -> keywords.id, filled as new keywords are seen
+_KEYWORD_IDS: dict[str, int] = {}
+
+
+def connect_keyword_db(db_path: pathlib.Path):
     """
-    Initialize the SQLite database -
-    create the 'keyword_popularity' table if it doesn't exist.
+    Open a connection to the keyword database,
+    using apsw when it is installed and sqlite3 otherwise.
+    Both are in autocommit mode and support cursor().execute() and
+    cursor().executemany(), so transactions are started explicitly.
 
     Args:
     - db_path (pathlib.Path): Path to the SQLite database file.
     """
-    logger.info("Calling keyword init_db() with {db_path=}.")
+    if apsw is not None:
+        conn = apsw.Connection(str(db_path))
+        # Wait for other writers like sqlite3 does (its default timeout is 5 s)
+        conn.setbusytimeout(5000)
+        return conn
+    return sqlite3.connect(str(db_path), isolation_level=None, check_same_thread=False)
+
+
+@contextmanager
+def _write_transaction(conn):
+    """
+    Run the block in one explicit write transaction and yield a cursor.
+    Commits on success; rolls back if the block or the COMMIT fails.
+
+    Args:
+    - conn: Open keyword database connection from connect_keyword_db().
+    """
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
     try:
-        # Ensure the directories for the db exist
-        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        yield cursor
+        cursor.execute("COMMIT")
+    except BaseException:
+        cursor.execute("ROLLBACK")
+        raise
 
-        with sqlite3.connect(db_path) as conn:
-            cursor = conn.cursor()
-            logger.info("SUCCESS: Got a cursor to execute SQL.")
 
-            cursor.execute("DROP TABLE IF EXISTS keyword_popularity;")
+def init_keyword_db(db_path: pathlib.Path):
+    """
+    Initialize the SQLite database (its directory must already exist) -
+    create the 'keywords' and 'keyword_popularity' tables
+    and the 'keyword_counts' view if they don't exist,
+    and open the connection used for all later updates.
+    Logs and re-raises any error, leaving no connection open.
 
+    Args:
+    - db_path (pathlib.Path): Path to the SQLite database file.
+    """
+    global _CONN
+    logger.info("Calling keyword init_db() with db_path={!r}.", db_path)
+    try:
+        close_keyword_db()
+        _CONN = connect_keyword_db(db_path)
+        _KEYWORD_IDS.clear()
+
+        cursor = _CONN.cursor()
+        logger.info("SUCCESS: Got a cursor to execute SQL.")
+
+        # WAL + synchronous=NORMAL avoids an fsync on every commit
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA wal_autocheckpoint=1000")
+        cursor.execute("PRAGMA cache_size=-20000")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+
+        with _write_transaction(_CONN) as cursor:
+            # Keywords are stored once; counts refer to them by integer id
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS keywords (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT UNIQUE
+                )
+            """
+            )
             cursor.execute(
                 """
                 CREATE TABLE IF NOT EXISTS keyword_popularity (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     hour_of_day INTEGER,
-                    keyword TEXT,
+                    keyword_id INTEGER REFERENCES keywords(id),
                     count INTEGER,
                     last_updated TEXT,
-                    UNIQUE(hour_of_day, keyword)
+                    UNIQUE(hour_of_day, keyword_id)
                 )
             """
             )
-            conn.commit()
-        logger.info(f"SUCCESS: Keyword database initialized and table ready at {db_path}.")
+            # Counts with keyword names, for querying
+            cursor.execute(
+                """
+                CREATE VIEW IF NOT EXISTS keyword_counts AS
+                SELECT p.hour_of_day, k.name AS keyword, p.count, p.last_updated
+                FROM keyword_popularity AS p
+                JOIN keywords AS k ON k.id = p.keyword_id
+            """
+            )
+        logger.info("SUCCESS: Keyword database initialized and table ready at {}.", db_path)
     except Exception as e:
-        logger.error(f"ERROR: Failed to initialize keyword database at {db_path}: {e}")
+        logger.error("ERROR: Failed to initialize keyword database at {}: {}", db_path, e)
+        close_keyword_db()
+        raise
+
+
+def close_keyword_db() -> None:
+    """
+    Close the keyword database connection if it is open.
+    """
+    global _CONN
+    if _CONN is not None:
+        _CONN.close()
+        _CONN = None
 
 
-def update_keyword_count(hour: int, keyword: str, db_path: pathlib.Path) -> None:
+def get_keyword_id(keyword: str, conn) -> int:
     """
-    Update (or insert) keyword count for a specific hour.
-    If the hour/keyword combination exists, increment the count.
-    If not, create a new record with count=1.
+    Return the id of a keyword, adding it to the 'keywords' table if needed.
+    Ids are cached, so the database is only queried for new keywords.
 
     Args:
-    - hour (int): Hour of day (0-23)
     - keyword (str): The keyword mentioned
-    - db_path (pathlib.Path): Path to the SQLite database file.
+    - conn: Open keyword database connection from connect_keyword_db().
+    """
+    keyword_id = _KEYWORD_IDS.get(keyword)
+    if keyword_id is None:
+        cursor = conn.cursor()
+        cursor.execute("INSERT OR IGNORE INTO keywords (name) VALUES (?)", (keyword,))
+        cursor.execute("SELECT id FROM keywords WHERE name = ?", (keyword,))
+        (keyword_id,) = cursor.fetchone()
+        _KEYWORD_IDS[keyword] = keyword_id
+    return keyword_id
+
+
+def update_keyword_counts(rows: list, conn) -> bool:
+    """
+    Add keyword counts for many hour/keyword combinations in one transaction.
+    Each row adds its count to the existing record for that hour/keyword,
+    creating the record if it does not exist yet.
+
+    Args:
+    - rows (list): List of (hour, keyword, count, last_updated) tuples.
+    - conn: Open keyword database connection from connect_keyword_db().
+
+    Returns:
+        True on success (or nothing to write), False if the batch was not written.
     """
-    logger.info(f"Updating keyword count: hour={hour}, keyword={keyword}")
+    if not rows:
+        return True
 
-    STR_PATH = str(db_path)
-    current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    
     try:
-        with sqlite3.connect(STR_PATH) as conn:
-            cursor = conn.cursor()
-            
-            # Try to update existing record
-            cursor.execute(
-                """
-                UPDATE keyword_popularity 
-                SET count = count + 1, last_updated = ?
-                WHERE hour_of_day = ? AND keyword = ?
-                """,
-                (current_time, hour, keyword)
+        # One explicit write transaction per flush
+        with _write_transaction(conn) as cursor:
+            cursor.executemany(
+                _UPSERT_SQL,
+                [
+                    (hour, get_keyword_id(keyword, conn), n, last_updated)
+                    for hour, keyword, n, last_updated in rows
+                ],
             )
-            
-            # If no rows were updated, insert new record
-            if cursor.rowcount == 0:
-                cursor.execute(
-                    """
-                    INSERT INTO keyword_popularity (hour_of_day, keyword, count, last_updated)
-                    VALUES (?, ?, 1, ?)
-                    """,
-                    (hour, keyword, current_time)
-                )
-                logger.info(f"Inserted new keyword record: {keyword} at hour {hour}")
-            else:
-                logger.info(f"Updated existing keyword record: {keyword} at hour {hour}")
-            
-            conn.commit()
+        logger.debug("Updated keyword counts for {} hour/keyword pairs.", len(rows))
+        return True
     except Exception as e:
-        logger.error(f"ERROR: Failed to update keyword count: {e}")
+        # Ids cached during a rolled-back transaction may not exist
+        _KEYWORD_IDS.clear()
+        logger.error("ERROR: Failed to update keyword counts: {}", e)
+        return False
 
 
 #####################################
@@ -134,6 +251,24 @@ def update_keyword_count(hour: int, keyword: str, db_path: pathlib.Path) -> None
 #####################################
 
 
+def _hour_from_timestamp(timestamp_str) -> int | None:
+    """
+    Return the hour of day (0-23) from a "YYYY-MM-DD HH:MM:SS" timestamp,
+    or None if the timestamp is malformed.
+
+    Args:
+        timestamp_str: The message's timestamp value.
+    """
+    # The hour is always characters 11-12
+    if not isinstance(timestamp_str, str):
+        return None
+    try:
+        hour_of_day = int(timestamp_str[11:13])
+    except ValueError:
+        return None
+    return hour_of_day if 0 <= hour_of_day <= 23 else None
+
+
 def process_message(message: dict) -> dict:
     """
     Process and analyze a single JSON message for keyword popularity.
@@ -147,35 +282,193 @@ def process_message(message: dict) -> dict:
         timestamp_str = message.get("timestamp")
         keyword = message.get("keyword_mentioned")
         
-        if not timestamp_str or not keyword:
+        # Keywords are counted by name, so only a non-empty string will do
+        if not timestamp_str or not keyword or not isinstance(keyword, str):
             logger.warning("Message missing timestamp or keyword, skipping")
             return None
             
-        # Parse the timestamp and extract hour
-        timestamp = datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M:%S")
-        hour_of_day = timestamp.hour
+        hour_of_day = _hour_from_timestamp(timestamp_str)
+        if hour_of_day is None:
+            logger.warning("Message has malformed timestamp {!r}, skipping", timestamp_str)
+            return None
         
         processed_data = {
             "hour_of_day": hour_of_day,
             "keyword": keyword
         }
         
-        logger.info(f"Processed message: keyword='{keyword}' at hour={hour_of_day}")
+        logger.debug("Processed message: keyword={!r} at hour={}", keyword, hour_of_day)
         return processed_data
     except Exception as e:
-        logger.error(f"Error processing message: {e}")
+        logger.error("Error processing message: {}", e)
         return None
 
 
+#####################################
+# Count Messages in a Batch of Lines
+#####################################
+
+
+def _count_line(line: bytes, counts: Counter) -> None:
+    """
+    Fully parse one raw line and count its (hour, keyword) pair.
+
+    Args:
+    - line (bytes): One JSON message without the trailing newline.
+    - counts (Counter): Counts keyed by (hour, keyword), updated in place.
+    """
+    # Skip blank lines
+    if line and not line.isspace():
+
+        # Parse the raw bytes (surrounding whitespace is allowed)
+        message = _json.loads(line)
+
+        # Call our process_message function
+        processed_data = process_message(message)
+
+        # If we have processed data, count it
+        if processed_data:
+            counts[(processed_data["hour_of_day"], processed_data["keyword"])] += 1
+
+
+def _extract_parsed(line: bytes) -> tuple | None:
+    """
+    Parse one line and return its (hour, keyword) pair without going
+    through process_message() and its per-message logging.
+    Returns None for any line process_message() would skip or that needs
+    its warning, so the caller falls back to _count_line().
+    Every line gets the full JSON parse, so malformed JSON raises
+    ValueError and the result always matches _count_line().
+
+    Args:
+    - line (bytes): One JSON message without the trailing newline.
+    """
+    if not line or line.isspace():
+        return None
+    message = _json.loads(line)
+    if type(message) is not dict:
+        return None
+    keyword = message.get("keyword_mentioned")
+    if not keyword or not isinstance(keyword, str):
+        return None
+    hour_of_day = _hour_from_timestamp(message.get("timestamp"))
+    if hour_of_day is None:
+        return None
+    return hour_of_day, keyword
+
+
+def count_messages(lines: list, counts: Counter) -> None:
+    """
+    Count the (hour, keyword) pair of every complete line read from the file.
+    Parses each line and reads the two fields directly; any line the fast
+    path cannot handle goes through process_message().
+
+    Args:
+    - lines (list): The complete lines read from the file, without newlines.
+    - counts (Counter): Counts keyed by (hour, keyword), updated in place.
+    """
+    for line in lines:
+        found = _extract_parsed(line)
+        if found:
+            counts[found] += 1
+        else:
+            _count_line(line, counts)
+
+
+#####################################
+# Wait for New Data in the Live Data File
+#####################################
+
+
+def open_file_watcher(live_data_path: pathlib.Path):
+    """
+    Watch the live data file for appended data using inotify.
+    Returns None (so the consumer polls instead) when inotify is unavailable.
+
+    Args:
+    - live_data_path (pathlib.Path): Path to the live data file.
+    """
+    if inotify_simple is None:
+        return None
+    try:
+        watcher = inotify_simple.INotify()
+        watcher.add_watch(str(live_data_path), inotify_simple.flags.MODIFY)
+        return watcher
+    except OSError as e:
+        logger.warning("Could not watch {}, polling instead: {}", live_data_path, e)
+        return None
+
+
+def wait_for_new_data(watcher, interval_secs: int) -> None:
+    """
+    Block until the live data file is modified.
+    Waits at most interval_secs, so a lost watch (e.g. the file was replaced)
+    degrades to polling rather than hanging.
+
+    Args:
+    - watcher: Watcher from open_file_watcher(), or None to just sleep.
+    - interval_secs (int): Longest time to wait, in seconds.
+    """
+    if watcher is None:
+        time.sleep(interval_secs)
+    else:
+        watcher.read(timeout=interval_secs * 1000)
+
+
+def read_new_data(fd: int, position: int) -> bytes:
+    """
+    Read everything in the file after position.
+    Uses a single positional read (pread) where the OS supports it,
+    otherwise seeks and reads.
+
+    Args:
+    - fd (int): Open file descriptor for the live data file.
+    - position (int): Byte offset to start reading from.
+    """
+    size = os.fstat(fd).st_size - position
+    if size <= 0:
+        return b""
+    if hasattr(os, "pread"):
+        return os.pread(fd, size, position)
+    os.lseek(fd, position, os.SEEK_SET)
+    return os.read(fd, size)
+
+
+def live_file_replaced(fd: int, live_data_path: pathlib.Path, position: int) -> bool:
+    """
+    Return True if the live data file was replaced or truncated since fd was
+    opened (the producer deletes and recreates it every time it starts).
+
+    Args:
+    - fd (int): Open file descriptor for the live data file.
+    - live_data_path (pathlib.Path): Path to the live data file.
+    - position (int): Byte offset read so far.
+    """
+    try:
+        current = os.stat(live_data_path)
+    except FileNotFoundError:
+        # Deleted but not recreated yet; keep the old file until a new one appears
+        return False
+    opened = os.fstat(fd)
+    if (current.st_ino, current.st_dev) != (opened.st_ino, opened.st_dev):
+        return True
+    return current.st_size < position
+
+
 #####################################
 # Consume Messages from Live Data File
 #####################################
 
+# Stop the consumer after this many failed database writes in a row
+MAX_FLUSH_FAILURES = 5
+
 
 def consume_messages_from_file(live_data_path, sql_path, interval_secs, last_position):
     """
     Consume new messages from a file and process them for keyword analysis.
     Each message is expected to be JSON-formatted.
+    The keyword database must already be initialized with init_keyword_db().
+    Exits after MAX_FLUSH_FAILURES failed database writes in a row.
 
     Args:
     - live_data_path (pathlib.Path): Path to the live data file.
@@ -184,55 +477,84 @@ def consume_messages_from_file(live_data_path, sql_path, interval_secs, last_pos
     - last_position (int): Last read position in the file.
     """
     logger.info("Called consume_messages_from_file() with:")
-    logger.info(f"   {live_data_path=}")
-    logger.info(f"   {sql_path=}")
-    logger.info(f"   {interval_secs=}")
-    logger.info(f"   {last_position=}")
-
-    logger.info("1. Initialize the keyword database.")
-    init_keyword_db(sql_path)
+    logger.info("   live_data_path={!r}", live_data_path)
+    logger.info("   sql_path={!r}", sql_path)
+    logger.info("   interval_secs={!r}", interval_secs)
+    logger.info("   last_position={!r}", last_position)
 
-    logger.info("2. Set the last position to 0 to start at the beginning of the file.")
+    logger.info("1. Set the last position to 0 to start at the beginning of the file.")
     last_position = 0
 
-    while True:
-        try:
-            logger.info(f"3. Read from live data file at position {last_position}.")
-            with open(live_data_path, "r") as file:
-                # Move to the last read position
-                file.seek(last_position)
-                for line in file:
-                    # If we strip whitespace and there is content
-                    if line.strip():
-
-                        # Use json.loads to parse the stripped line
-                        message = json.loads(line.strip())
-
-                        # Call our process_message function
-                        processed_data = process_message(message)
-
-                        # If we have processed data, update keyword count
-                        if processed_data:
-                            update_keyword_count(
-                                processed_data["hour_of_day"],
-                                processed_data["keyword"],
-                                sql_path
-                            )
-
-                # Update the last position that's been read to the current file position
-                last_position = file.tell()
-
-                # Return the last position to be used in the next iteration
-                return last_position
-
-        except FileNotFoundError:
-            logger.error(f"ERROR: Live data file not found at {live_data_path}.")
-            sys.exit(10)
-        except Exception as e:
-            logger.error(f"ERROR: Error reading from live data file: {e}")
-            sys.exit(11)
+    watcher = open_file_watcher(live_data_path)
 
-        time.sleep(interval_secs)
+    # One descriptor is kept open for the whole run instead of reopening the file
+    fd = None
+    flush_failures = 0
+    try:
+        while True:
+            try:
+                if fd is not None and live_file_replaced(fd, live_data_path, last_position):
+                    logger.info("Live data file was replaced; reading the new file from the start.")
+                    os.close(fd)
+                    fd = None
+                    last_position = 0
+                    # The old watch follows the deleted file, so watch the new one
+                    if watcher is not None:
+                        watcher.close()
+                    watcher = open_file_watcher(live_data_path)
+                if fd is None:
+                    fd = os.open(live_data_path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+                data = read_new_data(fd, last_position)
+
+                # Nothing new since the last pass: stay quiet and wait again
+                if data:
+                    logger.info("2. Read from live data file at position {}.", last_position)
+
+                    # Split on newlines in bulk; the last piece is a partial line (or empty)
+                    # and is left in the file to be read again on the next pass
+                    lines = data.split(b"\n")
+                    tail = lines.pop()
+
+                    # Count messages per (hour, keyword) so each pair is written once
+                    counts = Counter()
+                    count_messages(lines, counts)
+
+                    # Write one row per hour/keyword pair with a single executemany and commit,
+                    # stamping every row with the same last_updated time
+                    now_str = time.strftime("%Y-%m-%d %H:%M:%S")
+                    rows = [(hour, keyword, n, now_str) for (hour, keyword), n in counts.items()]
+                    # Only advance past the processed lines once they are stored;
+                    # after a failed write the same lines are read again next pass
+                    if update_keyword_counts(rows, _CONN):
+                        logger.info("Processed {} messages.", sum(counts.values()))
+                        last_position += len(data) - len(tail)
+                        flush_failures = 0
+                    else:
+                        flush_failures += 1
+
+            except FileNotFoundError:
+                logger.error("ERROR: Live data file not found at {}.", live_data_path)
+                sys.exit(10)
+            except Exception as e:
+                logger.error("ERROR: Error reading from live data file: {}", e)
+                sys.exit(11)
+
+            if flush_failures >= MAX_FLUSH_FAILURES:
+                logger.error(
+                    "ERROR: Giving up after {} failed database writes in a row.", flush_failures
+                )
+                sys.exit(12)
+            if flush_failures:
+                # Back off before retrying instead of waking on the next append
+                time.sleep(interval_secs * flush_failures)
+            else:
+                # Sleep until the producer appends more data
+                wait_for_new_data(watcher, interval_secs)
+    finally:
+        if fd is not None:
+            os.close(fd)
+        if watcher is not None:
+            watcher.close()
 
 
 #####################################
@@ -260,23 +582,31 @@ def main():
         
         logger.info("SUCCESS: Read environment variables.")
     except Exception as e:
-        logger.error(f"ERROR: Failed to read environment variables: {e}")
+        logger.error("ERROR: Failed to read environment variables: {}", e)
         sys.exit(1)
 
     logger.info("STEP 2. Delete any prior database file for a fresh start.")
-    if keyword_db_path.exists():
-        try:
-            keyword_db_path.unlink()
-            logger.info("SUCCESS: Deleted previous keyword database file.")
-        except Exception as e:
-            logger.error(f"ERROR: Failed to delete DB file: {e}")
-            sys.exit(2)
+    # Include the WAL sidecar files so a stale log is never replayed into the new db
+    for path in (
+        keyword_db_path,
+        keyword_db_path.with_name(keyword_db_path.name + "-wal"),
+        keyword_db_path.with_name(keyword_db_path.name + "-shm"),
+    ):
+        if path.exists():
+            try:
+                path.unlink()
+                logger.info("SUCCESS: Deleted previous keyword database file {}.", path.name)
+            except Exception as e:
+                logger.error("ERROR: Failed to delete DB file: {}", e)
+                sys.exit(2)
 
     logger.info("STEP 3. Initialize a new keyword database with an empty table.")
     try:
+        # Ensure the directories for the db exist
+        os.makedirs(keyword_db_path.parent, exist_ok=True)
         init_keyword_db(keyword_db_path)
     except Exception as e:
-        logger.error(f"ERROR: Failed to create keyword db table: {e}")
+        logger.error("ERROR: Failed to create keyword db table: {}", e)
         sys.exit(3)
 
     logger.info("STEP 4. Begin consuming and analyzing keyword popularity.")
@@ -285,8 +615,9 @@ def main():
     except KeyboardInterrupt:
         logger.warning("Keyword Consumer interrupted by user.")
     except Exception as e:
-        logger.error(f"ERROR: Unexpected error: {e}")
+        logger.error("ERROR: Unexpected error: {}", e)
     finally:
+        close_keyword_db()
         logger.info("TRY/FINALLY: Keyword Consumer shutting down.")
 
 
@@ -0,0 +1,370 @@
+"""
+tests/test_consumer_webb.py
+
+Tests for the keyword consumer: counting parity with a full parse,
+reading the live data file, and the keyword database.
+count_messages() must count exactly what a full JSON parse
+(orjson/json + process_message) counts, or raise where it raises.
+
+Usage:
+  pytest -q
+"""
+
+#####################################
+# Imports
+#####################################
+
+import os
+from collections import Counter
+
+import pytest
+
+from consumers import consumer_webb
+
+#####################################
+# Sample Lines
+#####################################
+
+# Lines that are counted
+VALID_LINES = [
+    b'{"message": "hi", "timestamp": "2025-01-01 05:00:00", "keyword_mentioned": "meme"}',
+    b'{"timestamp":"2025-01-01 23:59:59","keyword_mentioned":"Python"}',
+    # Reordered keys
+    b'{"keyword_mentioned": "game", "author": "Bob", "timestamp": "2025-01-01 00:10:00"}',
+    # \\u escapes in the keyword and elsewhere in the message
+    b'{"message": "caf\\u00e9", "timestamp": "2025-01-01 07:00:00", "keyword_mentioned": "caf\\u00e9"}',
+    b'{"timestamp": "2025-01-01 07:00:00", "keyword_mentioned": "q\\"x"}',
+    # Raw UTF-8 keyword
+    '{"timestamp": "2025-01-01 08:00:00", "keyword_mentioned": "café"}'.encode(),
+    # Key names appearing as values, and inside nested objects
+    b'{"category": "timestamp", "timestamp": "2025-01-01 09:00:00", "keyword_mentioned": "b"}',
+    b'{"meta": {"timestamp": "2025-01-01 01:00:00"}, "timestamp": "2025-01-01 14:00:00", "keyword_mentioned": "m"}',
+    b'{"tags": [{"keyword_mentioned": "x"}], "timestamp": "2025-01-01 14:00:00", "keyword_mentioned": "y"}',
+    # Duplicate keys: the last value wins
+    b'{"timestamp": "2025-01-01 02:00:00", "keyword_mentioned": "first", "keyword_mentioned": "last"}',
+    b'{"timestamp": "2025-01-01 02:00:00", "keyword_mentioned": "k", "timestamp": "2025-01-01 03:00:00"}',
+    b'{"timestamp": "2025-01-01 05:00:00", "keyword_mentioned": "a", "time\\u0073tamp": "2025-01-01 09:00:00"}',
+    # Surrounding whitespace and a Windows line ending
+    b'  {"timestamp": "2025-01-01 04:00:00", "keyword_mentioned": "c"}  \r',
+]
+
+# Lines skipped (with a warning)
+SKIPPED_LINES = [
+    b"",
+    b"   ",
+    b"\r",
+    b'{"timestamp": "2025-01-01 99:00:00", "keyword_mentioned": "bad"}',
+    b'{"timestamp": "2025-01-01 xx:00:00", "keyword_mentioned": "bad"}',
+    b'{"timestamp": "bad", "keyword_mentioned": "bad"}',
+    b'{"timestamp": "2025-01-01 07:00:00"}',
+    b'{"timestamp": "2025-01-01 07:00:00", "keyword_mentioned": ""}',
+    b'{"keyword_mentioned": "k"}',
+    b'{"timestamp": 5, "keyword_mentioned": "k"}',
+    # Keywords that are not strings (unhashable or not a name)
+    b'{"timestamp": "2025-01-01 07:00:00", "keyword_mentioned": ["a"]}',
+    b'{"timestamp": "2025-01-01 07:00:00", "keyword_mentioned": {"k": "a"}}',
+    b'{"timestamp": "2025-01-01 07:00:00", "keyword_mentioned": 7}',
+    b'{"timestamp": "2025-01-01 07:00:00", "keyword_mentioned": true}',
+    b'["timestamp", "keyword_mentioned"]',
+]
+
+# Malformed JSON that a full parse rejects
+MALFORMED_LINES = [
+    b'{"timestamp": "2025-01-01 05:00:00", "keyword_mentioned": "a"} trailing',
+    b'{"timestamp": "2025-01-01 05:00:00", "keyword_mentioned": "a"}}',
+    b'{"timestamp": "2025-01-01 05:00:00", "keyword_mentioned": "a"',
+    b'{"timestamp": "2025-01-01 05:00:00", "keyword_mentioned": "a',
+    b"not json",
+    # Grammar errors that only a real parser catches
+    b'{"timestamp": "2025-01-01 05:00:00" "keyword_mentioned": "a"}',
+    b'{"timestamp": "2025-01-01 05:00:00", "keyword_mentioned": "a"]',
+    b'{"timestamp": "2025-01-01 05:00:00", "keyword_mentioned": "a", "n": 01}',
+]
+
+# A typical producer message, placed ahead of the line under test
+CANONICAL_LINE = (
+    b'{"message": "m", "author": "A", "timestamp": "2025-01-01 06:00:00", '
+    b'"category": "c", "sentiment": 0.5, "keyword_mentioned": "k", "message_length": 1}'
+)
+
+#####################################
+# Helper Functions
+#####################################
+
+
+def _full_parse(lines: list) -> Counter:
+    """Count lines the way the consumer did before any fast path."""
+    counts = Counter()
+    for line in lines:
+        consumer_webb._count_line(line, counts)
+    return counts
+
+
+def _fast_count(lines: list, tail: bytes = b"") -> Counter:
+    """Count lines with count_messages(), as the consumer reads them from the file."""
+    data = b"".join(line + b"\n" for line in lines) + tail
+    counts = Counter()
+    consumer_webb.count_messages(data.split(b"\n")[:-1], counts)
+    return counts
+
+
+def _assert_parity(lines: list) -> None:
+    assert _fast_count(lines) == _full_parse(lines)
+
+
+def _keyword_counts(conn) -> list:
+    """Return (hour, keyword, count) rows from the keyword_counts view."""
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT hour_of_day, keyword, count FROM keyword_counts ORDER BY hour_of_day, keyword"
+    )
+    return [tuple(row) for row in cursor.fetchall()]
+
+
+#####################################
+# Counting Messages
+#####################################
+
+
+@pytest.mark.parametrize(
+    "timestamp, hour",
+    [
+        ("2025-01-01 00:00:00", 0),
+        ("2025-01-01 23:59:59", 23),
+        ("2025-01-01 24:00:00", None),
+        ("2025-01-01 xx:00:00", None),
+        ("2025-01-01", None),
+        ("", None),
+        (5, None),
+    ],
+)
+def test_hour_from_timestamp(timestamp, hour):
+    assert consumer_webb._hour_from_timestamp(timestamp) == hour
+
+
+@pytest.mark.parametrize("line", SKIPPED_LINES)
+def test_skipped_line_counts_nothing(line: bytes):
+    assert _full_parse([line]) == Counter()
+    assert _fast_count([line]) == Counter()
+
+
+@pytest.mark.parametrize("line", VALID_LINES + SKIPPED_LINES)
+def test_count_messages_matches_full_parse(line: bytes):
+    # Every line is checked on its own, not just the first one
+    _assert_parity([CANONICAL_LINE, line])
+    _assert_parity([line])
+
+
+@pytest.mark.parametrize("line", MALFORMED_LINES)
+def test_count_messages_rejects_malformed_json(line: bytes):
+    with pytest.raises(ValueError):
+        _full_parse([CANONICAL_LINE, line])
+    with pytest.raises(ValueError):
+        _fast_count([CANONICAL_LINE, line])
+
+
+def test_count_messages_batch_and_partial_trailing_line():
+    lines = [CANONICAL_LINE] + VALID_LINES + SKIPPED_LINES + VALID_LINES[::-1]
+    partial = b'{"timestamp": "2025-01-01 05:00:00", "keyword_mentioned": "par'
+    assert _fast_count(lines, tail=partial) == _full_parse(lines)
+
+
+#####################################
+# Database Failures
+#####################################
+
+
+def test_init_keyword_db_raises_when_db_cannot_open(tmp_path):
+    # A directory cannot be opened as a database file
+    with pytest.raises(Exception):
+        consumer_webb.init_keyword_db(tmp_path)
+    assert consumer_webb._CONN is None
+
+
+def test_consumer_exits_after_repeated_flush_failures(tmp_path, monkeypatch):
+    live = tmp_path / "live.json"
+    live.write_bytes(VALID_LINES[0] + b"\n")
+    attempts = []
+    monkeypatch.setattr(
+        consumer_webb, "update_keyword_counts", lambda rows, conn: attempts.append(rows)
+    )
+    monkeypatch.setattr(consumer_webb, "open_file_watcher", lambda path: None)
+    monkeypatch.setattr(consumer_webb.time, "sleep", lambda secs: None)
+
+    with pytest.raises(SystemExit) as excinfo:
+        consumer_webb.consume_messages_from_file(live, tmp_path / "db.sqlite", 1, 0)
+    assert excinfo.value.code == 12
+    # The same unwritten line is retried until the consumer gives up
+    assert len(attempts) == consumer_webb.MAX_FLUSH_FAILURES
+    assert all(rows == attempts[0] for rows in attempts)
+
+
+#####################################
+# Reading the Live Data File
+#####################################
+
+
+@pytest.fixture
+def live_fd(tmp_path):
+    """Open a live data file holding two messages; yield (path, fd)."""
+    live = tmp_path / "live.json"
+    live.write_bytes(VALID_LINES[0] + b"\n" + VALID_LINES[1] + b"\n")
+    fd = os.open(live, os.O_RDONLY)
+    yield live, fd
+    os.close(fd)
+
+
+def test_live_file_not_replaced(live_fd):
+    live, fd = live_fd
+    size = live.stat().st_size
+    assert consumer_webb.live_file_replaced(fd, live, size) is False
+
+    # Appending is not a replacement
+    with open(live, "ab") as f:
+        f.write(VALID_LINES[2] + b"\n")
+    assert consumer_webb.live_file_replaced(fd, live, size) is False
+
+
+def test_live_file_replaced_with_new_file(live_fd):
+    live, fd = live_fd
+    live.unlink()
+    # Recreated larger than before, so only the inode tells it apart
+    live.write_bytes(b"\n".join(VALID_LINES) + b"\n")
+    assert consumer_webb.live_file_replaced(fd, live, 10) is True
+
+
+def test_live_file_truncated(live_fd):
+    live, fd = live_fd
+    size = live.stat().st_size
+    with open(live, "r+b") as f:
+        f.truncate(10)
+    assert consumer_webb.live_file_replaced(fd, live, size) is True
+
+
+def test_live_file_deleted_not_recreated(live_fd):
+    live, fd = live_fd
+    live.unlink()
+    # Keep reading the old file until a new one appears
+    assert consumer_webb.live_file_replaced(fd, live, 10) is False
+
+
+def test_read_new_data_from_position(live_fd):
+    live, fd = live_fd
+    first = len(VALID_LINES[0]) + 1
+    assert consumer_webb.read_new_data(fd, 0) == live.read_bytes()
+    assert consumer_webb.read_new_data(fd, first) == VALID_LINES[1] + b"\n"
+    assert consumer_webb.read_new_data(fd, live.stat().st_size) == b""
+
+
+def test_partial_last_line_is_read_again(tmp_path, monkeypatch):
+    live = tmp_path / "live.json"
+    line = b'{"timestamp": "2025-01-01 05:00:00", "keyword_mentioned": "a"}'
+    # The producer has written only half of the second message
+    live.write_bytes(line + b"\n" + line[:20])
+
+    passes = []
+
+    def finish_line_then_stop(watcher, interval_secs):
+        passes.append(interval_secs)
+        if len(passes) == 1:
+            with open(live, "ab") as f:
+                f.write(line[20:] + b"\n")
+        else:
+            raise KeyboardInterrupt
+
+    monkeypatch.setattr(consumer_webb, "open_file_watcher", lambda path: None)
+    monkeypatch.setattr(consumer_webb, "wait_for_new_data", finish_line_then_stop)
+    db_path = tmp_path / "db.sqlite"
+    consumer_webb.init_keyword_db(db_path)
+    try:
+        with pytest.raises(KeyboardInterrupt):
+            consumer_webb.consume_messages_from_file(live, db_path, 1, 0)
+        rows = _keyword_counts(consumer_webb._CONN)
+    finally:
+        consumer_webb.close_keyword_db()
+    # Both messages counted once: the partial line was neither lost nor split
+    assert rows == [(5, "a", 2)]
+
+
+#####################################
+# Keyword Database (sqlite3 and apsw)
+#####################################
+
+
+@pytest.fixture(params=["sqlite3", "apsw"])
+def keyword_db(request, tmp_path, monkeypatch):
+    """Initialize a temp keyword database with each driver; yield the connection."""
+    if request.param == "sqlite3":
+        monkeypatch.setattr(consumer_webb, "apsw", None)
+    elif consumer_webb.apsw is None:
+        pytest.skip("apsw not installed")
+    consumer_webb.init_keyword_db(tmp_path / "keywords.sqlite")
+    yield consumer_webb._CONN
+    consumer_webb.close_keyword_db()
+
+
+def test_update_keyword_counts_adds_to_existing_counts(keyword_db):
+    assert consumer_webb.update_keyword_counts(
+        [(5, "meme", 2, "t1"), (5, "game", 1, "t1"), (6, "meme", 4, "t1")], keyword_db
+    )
+    # The UPSERT adds to the stored count instead of replacing it
+    assert consumer_webb.update_keyword_counts([(5, "meme", 3, "t2")], keyword_db)
+    assert _keyword_counts(keyword_db) == [(5, "game", 1), (5, "meme", 5), (6, "meme", 4)]
+
+    cursor = keyword_db.cursor()
+    cursor.execute("SELECT last_updated FROM keyword_counts WHERE hour_of_day = 5 AND keyword = 'meme'")
+    assert cursor.fetchone()[0] == "t2"
+    # Each keyword is stored once
+    cursor.execute("SELECT COUNT(*) FROM keywords")
+    assert cursor.fetchone()[0] == 2
+
+
+def test_get_keyword_id_caches_ids(keyword_db):
+    meme_id = consumer_webb.get_keyword_id("meme", keyword_db)
+    assert consumer_webb.get_keyword_id("game", keyword_db) != meme_id
+    assert consumer_webb._KEYWORD_IDS == {
+        "meme": meme_id,
+        "game": consumer_webb.get_keyword_id("game", keyword_db),
+    }
+
+    # A cached id is returned without querying the database
+    keyword_db.cursor().execute("DELETE FROM keywords")
+    assert consumer_webb.get_keyword_id("meme", keyword_db) == meme_id
+
+
+def test_failed_flush_rolls_back_and_clears_keyword_ids(keyword_db):
+    assert consumer_webb.update_keyword_counts([(5, "meme", 1, "t1")], keyword_db)
+    keyword_db.cursor().execute("DROP VIEW keyword_counts")
+    keyword_db.cursor().execute("DROP TABLE keyword_popularity")
+
+    # "game" is added to keywords before the UPSERT fails
+    assert not consumer_webb.update_keyword_counts([(5, "game", 1, "t2")], keyword_db)
+    assert consumer_webb._KEYWORD_IDS == {}
+    cursor = keyword_db.cursor()
+    cursor.execute("SELECT name FROM keywords")
+    assert [tuple(row) for row in cursor.fetchall()] == [("meme",)]
+
+
+def test_write_transaction_rolls_back_on_error(keyword_db):
+    with pytest.raises(RuntimeError):
+        with consumer_webb._write_transaction(keyword_db) as cursor:
+            cursor.execute("INSERT INTO keywords (name) VALUES ('meme')")
+            raise RuntimeError("fail mid-transaction")
+
+    cursor = keyword_db.cursor()
+    cursor.execute("SELECT COUNT(*) FROM keywords")
+    assert cursor.fetchone()[0] == 0
+    # The connection is usable again after the rollback
+    with consumer_webb._write_transaction(keyword_db) as cursor:
+        cursor.execute("INSERT INTO keywords (name) VALUES ('meme')")
+    cursor = keyword_db.cursor()
+    cursor.execute("SELECT COUNT(*) FROM keywords")
+    assert cursor.fetchone()[0] == 1
+
+
+def test_init_keyword_db_keeps_existing_data(keyword_db, tmp_path):
+    assert consumer_webb.update_keyword_counts([(5, "meme", 2, "t1")], keyword_db)
+    consumer_webb.init_keyword_db(tmp_path / "keywords.sqlite")
+    assert consumer_webb._KEYWORD_IDS == {}
+    assert consumer_webb.update_keyword_counts([(5, "meme", 1, "t2")], consumer_webb._CONN)
+    assert _keyword_counts(consumer_webb._CONN) == [(5, "meme", 3)]